@@ -1,7 +1,23 @@
 import asyncio
+import cProfile
+import functools
+import gzip
+import io
 import json
+import multiprocessing
 import os
-
+import pstats
+import re
+import sqlite3
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from typing import Literal
+
+import aiohttp
 import discord
 from discord import app_commands
 
@@ -9,15 +25,72 @@ from discord import app_commands
 # OBVIOUSLY on the rapsipi
 # export DISCORD_TOKEN="your_token_here"
 # or inside Environment=DISCORD_TOKEN=your_token_here in the systemd service file if you use that method to run the bot
+# Sender processes (split mode) do not need it, the check runs when the client starts.
 TOKEN = os.getenv("DISCORD_TOKEN")
-if not TOKEN:
-    raise RuntimeError("DISCORD_TOKEN environment variable not set.")
 
 
 CONFIG_FOLDER = "configs"
+ARCHIVE_FOLDER = "archives"
+# Messages are flushed to the archive in batches so an interrupted export
+# only loses the last batch and can be resumed from there.
+ARCHIVE_BATCH_SIZE = 100
+# Archives can only be imported by the guild they were exported from. Set
+# ARCHIVE_ALLOW_CROSS_GUILD=1 on a host that receives archives from another
+# server, e.g. to migrate channels between servers.
+ARCHIVE_ALLOW_CROSS_GUILD = os.getenv("ARCHIVE_ALLOW_CROSS_GUILD") == "1"
+# How attachments are mirrored:
+# "auto" re-uploads files that fit the target's upload limit and links the rest,
+# "upload" always re-uploads, "link" never downloads and only posts the CDN URLs
+ATTACHMENT_MODES = ("auto", "upload", "link")
+DEFAULT_ATTACHMENT_MODE = "auto"
+# Pending relay messages are bounded per relay. When a queue is full:
+# "drop_oldest" discards the oldest pending message, "coalesce" merges new
+# messages into one digest, "pause" drops everything until the queue drained
+OVERFLOW_POLICIES = ("drop_oldest", "coalesce", "pause")
+DEFAULT_OVERFLOW_POLICY = "drop_oldest"
+DEFAULT_QUEUE_SIZE = 100
+MAX_DIGEST_MESSAGES = 50
+# The event loop is sampled every LOOP_LAG_INTERVAL seconds, a sample that
+# wakes up more than LOOP_LAG_WARN seconds late is logged as a blocked loop
+LOOP_LAG_INTERVAL = 0.5
+LOOP_LAG_WARN = 0.25
+# Optional split deployment: with SEND_QUEUE_PATH set, the gateway only puts
+# relay and copy sends into this SQLite queue and `python bot.py sender [N]`
+# runs N sender processes that download, split and send them
+SEND_QUEUE_PATH = os.getenv("SEND_QUEUE_PATH")
+DEFAULT_SEND_QUEUE_PATH = "send_queue.db"
+SENDER_POLL_INTERVAL = 0.5
+SEND_RESULTS_INTERVAL = 1.0
+# Wait after a failed send queue access (e.g. database locked) before retrying
+SENDER_ERROR_BACKOFF = 2.0
+# A claimed job whose sender died is handed out again after this many seconds
+SEND_CLAIM_TIMEOUT = 600
+# Unfinished jobs allowed per target before the gateway stops queuing more,
+# so floods are still handled by the relay queues instead of growing the jobs
+SEND_MAX_PENDING_PER_TARGET = 3
+# How often CONFIG_FOLDER is checked for configs edited outside the bot
+CONFIG_POLL_INTERVAL = 0.5
 
 config_locks = {}
+archive_locks = {}
+config_cache = {}
+config_mtimes = {}
+config_reports = []
+relay_index = {}
+relay_snapshots = {}
 webhook_cache = {}
+filter_cache = {}
+relay_queues = {}
+stage_stats = {}
+loop_lag = {"samples": 0, "total": 0.0, "max": 0.0, "last": 0.0}
+lag_monitor_task = None
+send_queue = None
+send_queue_lock = threading.Lock()
+send_slots = asyncio.Condition()
+pending_sends = {}
+config_watcher_task = None
+send_results_task = None
+profile_lock = asyncio.Lock()
 
 intents = discord.Intents.default()
 intents.members = True
@@ -26,6 +99,143 @@ client = discord.Client(intents=intents)
 tree = app_commands.CommandTree(client)
 
 
+# ==================================================
+# Instrumentation
+# ==================================================
+
+
+@contextmanager
+def stage_timer(name: str):
+    """
+    Measures the wall time of a code block and adds it to stage_stats.
+    Works around awaits too, so async stages include their waiting time.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stats = stage_stats.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+        stats["count"] += 1
+        stats["total"] += elapsed
+        stats["max"] = max(stats["max"], elapsed)
+
+
+def timed(name: str):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+async def monitor_loop_lag():
+    """
+    Sleeps in a loop and measures how late it wakes up. Anything that
+    blocks the event loop (disk I/O, JSON parsing, CPU work) shows up
+    as lag here.
+    """
+    loop = asyncio.get_running_loop()
+
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(0.0, loop.time() - start - LOOP_LAG_INTERVAL)
+
+        loop_lag["samples"] += 1
+        loop_lag["total"] += lag
+        loop_lag["max"] = max(loop_lag["max"], lag)
+        loop_lag["last"] = lag
+
+        if lag > LOOP_LAG_WARN:
+            print(f"[WARN] Event loop blocked for {lag * 1000:.0f} ms")
+
+
+def format_performance_stats():
+    samples = loop_lag["samples"]
+    average = loop_lag["total"] / samples if samples else 0.0
+
+    lines = [
+        f"Loop lag: last {loop_lag['last'] * 1000:.1f} ms | "
+        f"avg {average * 1000:.1f} ms | max {loop_lag['max'] * 1000:.1f} ms"
+    ]
+
+    for name, stats in sorted(stage_stats.items()):
+        lines.append(
+            f"{name}: {stats['count']}x | "
+            f"avg {stats['total'] / stats['count'] * 1000:.1f} ms | "
+            f"max {stats['max'] * 1000:.1f} ms"
+        )
+
+    return "\n".join(lines)
+
+
+def chunk_lines(text: str, limit: int):
+    """
+    Splits text into chunks of whole lines, keeping whitespace intact so
+    tables stay aligned. Lines longer than `limit` are cut.
+    """
+    chunks = []
+    current = []
+    size = 0
+
+    for line in text.splitlines():
+        line = line[:limit]
+
+        if current and size + len(line) + 1 > limit:
+            chunks.append("\n".join(current))
+            current = []
+            size = 0
+
+        current.append(line)
+        size += len(line) + 1
+
+    if current:
+        chunks.append("\n".join(current))
+
+    return chunks
+
+
+async def run_cpu_profile(seconds: int):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+
+    buffer = io.StringIO()
+    pstats.Stats(profiler, stream=buffer).sort_stats("tottime").print_stats(15)
+
+    # Skip the pstats header, keep the table
+    lines = buffer.getvalue().strip().splitlines()
+    start = next((i for i, line in enumerate(lines) if "ncalls" in line), 0)
+    return "\n".join(lines[start:])
+
+
+async def run_memory_profile(seconds: int):
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+
+    try:
+        before = tracemalloc.take_snapshot()
+        await asyncio.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started:
+            tracemalloc.stop()
+
+    lines = [f"Traced: {current / 1024:.0f} KiB | peak {peak / 1024:.0f} KiB"]
+    lines.extend(str(stat) for stat in after.compare_to(before, "lineno")[:15])
+    return "\n".join(lines)
+
+
 # ---------- Helper functions ----------
 
 
@@ -33,10 +243,34 @@ def get_config_path(guild_id: int):
     return os.path.join(CONFIG_FOLDER, f"{guild_id}.json")
 
 
-def save_config(guild_id: int, data: dict):
+def save_config(guild_id: int, data: dict, validate=True):
+    # Stats updates leave the relays alone and skip the validation
+    previous = relay_snapshots.get(guild_id)
+    if validate and previous != relay_snapshot(data):
+        # Relays that were saved before are already checked by apply_config,
+        # invalid ones are disabled there and must not block other changes
+        known = {json.dumps(r, sort_keys=True) for r in json.loads(previous or "[]")}
+        try:
+            validate_config(data)
+            validate_relays(data.get("relays", []), known)
+        except ValueError:
+            # Commands change the cached config in place, forget it so the
+            # next access reads the last saved version from disk again
+            config_cache.pop(guild_id, None)
+            raise
+
     os.makedirs(CONFIG_FOLDER, exist_ok=True)
-    with open(get_config_path(guild_id), "w") as f:
+    path = get_config_path(guild_id)
+
+    # Write to a temp file first so the config watcher never sees half a file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
         json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+    # Remember our own write so the watcher does not reload it
+    config_mtimes[guild_id] = os.stat(path).st_mtime_ns
+    apply_config(guild_id, data)
 
 
 # ==================================================
@@ -44,10 +278,13 @@ def save_config(guild_id: int, data: dict):
 # ==================================================
 
 
+@timed("load_and_prepare_config")
 def load_and_prepare_config(guild_id: int):
     """
-    Loads the guild configuration from disk and ensures
-    required keys exist.
+    Returns the guild configuration from the in-memory cache.
+
+    The disk is only read the first time a guild is seen; after that
+    the cache is kept up to date by save_config and the config watcher.
 
     Args:
         guild_id (int): Discord guild ID
@@ -55,14 +292,47 @@ def load_and_prepare_config(guild_id: int):
     Returns:
         dict | None: Prepared config or None if not found
     """
+    if guild_id in config_cache:
+        return config_cache[guild_id]
+
+    try:
+        config = read_config(guild_id)
+    except ValueError as e:
+        # Without a readable config there is no error channel to report to
+        print(f"[ERROR] Guild: {guild_id} | Invalid config: {e}")
+        config = None
+
+    apply_config(guild_id, config)
+    return config
+
+
+def read_config(guild_id: int):
+    """
+    Reads the guild configuration from disk, validates its structure and
+    ensures required keys exist. Invalid relays are not rejected here,
+    apply_config disables and reports them.
+
+    Args:
+        guild_id (int): Discord guild ID
+
+    Returns:
+        dict | None: Prepared config or None if not found
+
+    Raises:
+        ValueError: If the file is not valid JSON or its structure is invalid
+    """
     path = get_config_path(guild_id)
 
     if not os.path.exists(path):
         return None
 
+    config_mtimes[guild_id] = os.stat(path).st_mtime_ns
+
     with open(path, "r") as f:
         config = json.load(f)
 
+    validate_config(config)
+
     changed = False
 
     if "relays" not in config:
@@ -78,11 +348,199 @@ def load_and_prepare_config(guild_id: int):
         changed = True
 
     if changed:
-        save_config(guild_id, config)
+        save_config(guild_id, config, validate=False)
 
     return config
 
 
+def validate_config(config):
+    if not isinstance(config, dict):
+        raise ValueError("config must be a JSON object")
+
+    if not isinstance(config.get("error_channel"), int):
+        raise ValueError("error_channel must be a channel ID")
+
+    if not isinstance(config.get("stats", {}), dict):
+        raise ValueError("stats must be an object")
+
+    if not isinstance(config.get("relays", []), list):
+        raise ValueError("relays must be a list")
+
+
+def validate_relays(relays: list, known=()):
+    sources = [r.get("source") for r in relays if isinstance(r, dict)]
+
+    for i, relay in enumerate(relays, start=1):
+        if json.dumps(relay, sort_keys=True) in known:
+            continue
+
+        validate_relay(relay, i)
+
+        if sources.count(relay["source"]) > 1:
+            raise ValueError(f"relay {i}: duplicate source {relay['source']}")
+
+
+def validate_relay(relay, i: int):
+    if not isinstance(relay, dict):
+        raise ValueError(f"relay {i} must be an object")
+
+    for key in ("source", "target", "delay"):
+        if not isinstance(relay.get(key), int):
+            raise ValueError(f"relay {i}: {key} must be a number")
+
+    if relay["delay"] < 0:
+        raise ValueError(f"relay {i}: delay must not be negative")
+
+    attachment_mode = relay.get("attachment_mode", DEFAULT_ATTACHMENT_MODE)
+    if attachment_mode not in ATTACHMENT_MODES:
+        raise ValueError(f"relay {i}: unknown attachment_mode {attachment_mode!r}")
+
+    overflow = relay.get("overflow", DEFAULT_OVERFLOW_POLICY)
+    if overflow not in OVERFLOW_POLICIES:
+        raise ValueError(f"relay {i}: unknown overflow policy {overflow!r}")
+
+    queue_size = relay.get("queue_size", DEFAULT_QUEUE_SIZE)
+    if not isinstance(queue_size, int) or queue_size < 1:
+        raise ValueError(f"relay {i}: queue_size must be a positive number")
+
+    filters = relay.get("filters", {})
+    if not isinstance(filters, dict):
+        raise ValueError(f"relay {i}: filters must be an object")
+
+    for key in ("keywords", "attachment_types"):
+        values = filters.get(key, [])
+        if not isinstance(values, list) or not all(
+            isinstance(v, str) for v in values
+        ):
+            raise ValueError(f"relay {i}: filters.{key} must be a list of text")
+
+    for key in ("allowed_authors", "blocked_authors"):
+        values = filters.get(key, [])
+        if not isinstance(values, list) or not all(
+            isinstance(v, int) for v in values
+        ):
+            raise ValueError(f"relay {i}: filters.{key} must be a list of user IDs")
+
+    patterns = filters.get("regex", [])
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    if not isinstance(patterns, list) or not all(
+        isinstance(p, str) for p in patterns
+    ):
+        raise ValueError(f"relay {i}: filters.regex must be a list of patterns")
+
+    for pattern in patterns:
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            raise ValueError(f"relay {i}: invalid regex {pattern!r}: {e}")
+
+
+def relay_snapshot(config):
+    return json.dumps(config.get("relays", []) if config else [], sort_keys=True)
+
+
+def apply_config(guild_id: int, config):
+    """
+    Puts a guild config into the in-memory cache. If its relays changed,
+    rebuilds everything derived from them: the source → relay lookup
+    table, compiled filters and the queues of relays that no longer exist.
+
+    Invalid relays are left out of the lookup table and reported to the
+    error channel by the config watcher, the rest of the guild keeps working.
+    """
+    config_cache[guild_id] = config
+
+    snapshot = relay_snapshot(config)
+    if relay_snapshots.get(guild_id) == snapshot:
+        return
+    relay_snapshots[guild_id] = snapshot
+
+    index = {}
+    for i, relay in enumerate(config.get("relays", []) if config else [], start=1):
+        try:
+            validate_relay(relay, i)
+            if relay["source"] in index:
+                raise ValueError(f"relay {i}: duplicate source {relay['source']}")
+        except ValueError as e:
+            config_reports.append((guild_id, f"Relay disabled, {e}"))
+            continue
+
+        index[relay["source"]] = relay
+
+    relay_index[guild_id] = index
+
+    for key in [k for k in filter_cache if k[0] == guild_id]:
+        del filter_cache[key]
+
+    for key in [k for k in relay_queues if k[0] == guild_id]:
+        if key[1] not in relay_index[guild_id]:
+            stop_relay_queue(*key)
+
+
+async def reload_changed_configs():
+    """
+    Reloads configs in CONFIG_FOLDER whose modification time changed
+    since they were last read or written by the bot. Invalid configs
+    are reported and the previous version stays active.
+    """
+    seen = set()
+
+    if os.path.isdir(CONFIG_FOLDER):
+        with os.scandir(CONFIG_FOLDER) as entries:
+            for entry in entries:
+                name, extension = os.path.splitext(entry.name)
+                if extension != ".json" or not name.isdigit():
+                    continue
+
+                guild_id = int(name)
+                seen.add(guild_id)
+
+                mtime = entry.stat().st_mtime_ns
+                if config_mtimes.get(guild_id) == mtime:
+                    continue
+
+                try:
+                    config = read_config(guild_id)
+                except ValueError as e:
+                    # Do not report the same broken version again
+                    config_mtimes[guild_id] = mtime
+                    await send_error(
+                        client.get_guild(guild_id),
+                        f"Config {entry.name} not reloaded: {e}",
+                    )
+                    continue
+
+                if guild_id in config_cache:
+                    print(f"[CONFIG] Reloaded {entry.name}")
+                apply_config(guild_id, config)
+
+    # Deleted configs
+    for guild_id in [g for g in config_mtimes if g not in seen]:
+        del config_mtimes[guild_id]
+        apply_config(guild_id, None)
+        print(f"[CONFIG] Removed config of guild {guild_id}")
+
+
+async def watch_configs():
+    """
+    Polls CONFIG_FOLDER so configs edited by hand or by scripts are
+    applied within a second, without reading the disk per message.
+    """
+    while True:
+        try:
+            await reload_changed_configs()
+        except OSError as e:
+            print(f"[ERROR] Config watcher: {e}")
+
+        while config_reports:
+            guild_id, message = config_reports.pop(0)
+            await send_error(client.get_guild(guild_id), message)
+
+        await asyncio.sleep(CONFIG_POLL_INTERVAL)
+
+
+@timed("split_message")
 def split_message(content, limit=2000):
     parts = []
 
@@ -112,6 +570,15 @@ def split_message(content, limit=2000):
 async def send_error(guild: discord.Guild, message: str):
     print(f"[ERROR] Guild: {guild.id if guild else 'Unknown'} | {message}")
 
+    await send_notice(guild, f"⚠️ Bot Error:\n{message}")
+
+
+async def send_notice(guild: discord.Guild, message: str):
+    """
+    Posts a message to the guild's error channel. Used for errors and for
+    results of long-running commands, which can outlive the 15 minute
+    interaction token.
+    """
     if guild is None:
         return
 
@@ -128,7 +595,7 @@ async def send_error(guild: discord.Guild, message: str):
         return
 
     try:
-        await channel.send(f"⚠️ Bot Error:\n{message}")
+        await channel.send(message)
     except Exception as e:
         print(f"[ERROR] Failed to send error to channel: {e}")
 
@@ -138,19 +605,1161 @@ async def send_error(guild: discord.Guild, message: str):
 # ==================================================
 
 
-async def get_or_create_webhook(channel: discord.TextChannel):
-    if channel.id in webhook_cache:
-        return webhook_cache[channel.id]
+async def get_or_create_webhook(channel: discord.TextChannel):
+    if channel.id in webhook_cache:
+        return webhook_cache[channel.id]
+
+    webhooks = await channel.webhooks()
+    for hook in webhooks:
+        if hook.name == "DragonCopy":
+            webhook_cache[channel.id] = hook
+            return hook
+
+    hook = await channel.create_webhook(name="DragonCopy")
+    webhook_cache[channel.id] = hook
+    return hook
+
+
+async def prepare_attachments(attachments, mode: str, size_limit: int):
+    """
+    Decides per attachment whether it is re-uploaded or sent as a link.
+
+    Args:
+        attachments (list[discord.Attachment]): Attachments of the source message
+        mode (str): One of ATTACHMENT_MODES
+        size_limit (int): Upload limit of the target in bytes
+
+    Returns:
+        tuple[list[discord.File], list[str]]: Files to upload and URLs to link
+    """
+    files = []
+    links = []
+    uploaded = 0
+
+    for attachment in attachments:
+        # The limit applies to the whole request, not to every single file
+        too_large = uploaded + attachment.size > size_limit
+
+        if mode == "link" or (mode == "auto" and too_large):
+            links.append(attachment.url)
+            continue
+
+        with stage_timer("to_file"):
+            files.append(await attachment.to_file())
+        uploaded += attachment.size
+
+    return files, links
+
+
+def stored_attachment(attachment: discord.Attachment):
+    return {
+        "filename": attachment.filename,
+        "url": attachment.url,
+        "size": attachment.size,
+    }
+
+
+async def prepare_stored_attachments(
+    attachments, mode: str, size_limit: int, session=None
+):
+    """
+    Same as prepare_attachments for attachments stored as dicts (archives,
+    send queue). Files with a local "path" are read from disk, others are
+    downloaded with `session`. Without a session they are linked.
+
+    Returns:
+        tuple[list[discord.File], list[str]]: Files to upload and URLs to link
+    """
+    files = []
+    links = []
+    uploaded = 0
+
+    for attachment in attachments:
+        path = attachment.get("path")
+        too_large = uploaded + attachment["size"] > size_limit
+        available = os.path.exists(path) if path else session is not None
+
+        if mode == "link" or (mode == "auto" and too_large) or not available:
+            links.append(attachment["url"])
+            continue
+
+        with stage_timer("to_file"):
+            if path:
+                file = discord.File(path, filename=attachment["filename"])
+            else:
+                async with session.get(attachment["url"]) as response:
+                    response.raise_for_status()
+                    data = await response.read()
+                file = discord.File(io.BytesIO(data), filename=attachment["filename"])
+
+        files.append(file)
+        uploaded += attachment["size"]
+
+    return files, links
+
+
+async def send_via_webhook(webhook, content, username, avatar, files=None, links=None):
+    """
+    Sends a message through a webhook, split into Discord-sized parts.
+    Files are attached to the first part, links are appended to the content.
+
+    Returns:
+        int: Number of webhook messages sent
+    """
+    if links:
+        content = "\n".join([content, *links]) if content else "\n".join(links)
+
+    if not content and not files:
+        return 0
+
+    parts = split_message(content) if content else [""]
+
+    for i, part in enumerate(parts):
+        with stage_timer("webhook.send"):
+            if i == 0 and files:
+                await webhook.send(
+                    content=part,
+                    username=username,
+                    avatar_url=avatar,
+                    files=files,
+                )
+            else:
+                await webhook.send(
+                    content=part, username=username, avatar_url=avatar
+                )
+
+        await asyncio.sleep(1.0)
+
+    return len(parts)
+
+
+# ==================================================
+# Send queue
+# ==================================================
+
+
+def open_send_queue(path: str):
+    # Autocommit mode, transactions are opened explicitly where needed.
+    # The gateway uses its connection from worker threads, one at a time.
+    connection = sqlite3.connect(
+        path, timeout=30, isolation_level=None, check_same_thread=False
+    )
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            webhook_url TEXT NOT NULL,
+            payload TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_webhook ON jobs (webhook_url, id);
+        CREATE TABLE IF NOT EXISTS targets (
+            webhook_url TEXT PRIMARY KEY,
+            busy_since REAL
+        );
+        CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            webhook_url TEXT NOT NULL,
+            copied INTEGER NOT NULL,
+            error TEXT
+        );
+        """
+    )
+    return connection
+
+
+async def run_send_queue(func, *args):
+    """
+    Runs a send queue function with the gateway's connection in a worker
+    thread, so waiting for the SQLite lock never blocks the event loop.
+    """
+
+    def call():
+        with send_queue_lock:
+            return func(send_queue, *args)
+
+    return await asyncio.to_thread(call)
+
+
+def enqueue_send(connection, guild_id: int, webhook_url: str, payload: dict):
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        connection.execute(
+            "INSERT INTO jobs (guild_id, webhook_url, payload) VALUES (?, ?, ?)",
+            (guild_id, webhook_url, json.dumps(payload)),
+        )
+        connection.execute(
+            "INSERT OR IGNORE INTO targets (webhook_url) VALUES (?)", (webhook_url,)
+        )
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+
+
+def count_pending_sends(connection):
+    return dict(
+        connection.execute(
+            "SELECT webhook_url, COUNT(*) FROM jobs GROUP BY webhook_url"
+        ).fetchall()
+    )
+
+
+def find_claimable_job(connection, stale: float):
+    # Only the oldest job of every idle target can be claimed. The cost
+    # grows with the number of targets, not with the number of queued jobs.
+    return connection.execute(
+        """
+        SELECT job.id, job.guild_id, job.webhook_url, job.payload
+        FROM targets
+        JOIN jobs AS job ON job.id = (
+            SELECT id FROM jobs
+            WHERE jobs.webhook_url = targets.webhook_url
+            ORDER BY id
+            LIMIT 1
+        )
+        WHERE targets.busy_since IS NULL OR targets.busy_since < ?
+        ORDER BY job.id
+        LIMIT 1
+        """,
+        (stale,),
+    ).fetchone()
+
+
+def claim_send_job(connection):
+    """
+    Claims the oldest job of a target that has no job in flight.
+    Jobs of one target are therefore sent one after another in order,
+    while different targets are spread over all sender processes.
+
+    Returns:
+        tuple | None: (id, guild_id, webhook_url, payload) or None if idle
+    """
+    now = time.time()
+    stale = now - SEND_CLAIM_TIMEOUT
+
+    # Cheap check without the write lock, most polls find nothing to do
+    if not find_claimable_job(connection, stale):
+        return None
+
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        job = find_claimable_job(connection, stale)
+        if job:
+            connection.execute(
+                "UPDATE targets SET busy_since = ? WHERE webhook_url = ?",
+                (now, job[2]),
+            )
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+
+    return job
+
+
+def finish_send_job(
+    connection, job_id: int, guild_id: int, webhook_url: str, copied: int, error
+):
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        connection.execute(
+            "UPDATE targets SET busy_since = NULL WHERE webhook_url = ?",
+            (webhook_url,),
+        )
+        connection.execute(
+            """
+            DELETE FROM targets WHERE webhook_url = ?
+            AND NOT EXISTS (SELECT 1 FROM jobs WHERE webhook_url = ?)
+            """,
+            (webhook_url, webhook_url),
+        )
+        connection.execute(
+            """
+            INSERT INTO results (guild_id, webhook_url, copied, error)
+            VALUES (?, ?, ?, ?)
+            """,
+            (guild_id, webhook_url, copied, error),
+        )
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+
+
+def take_send_results(connection):
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        results = connection.execute(
+            "SELECT id, guild_id, webhook_url, copied, error FROM results ORDER BY id"
+        ).fetchall()
+        if results:
+            connection.execute("DELETE FROM results WHERE id <= ?", (results[-1][0],))
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+
+    return results
+
+
+async def wait_for_send_slot(webhook_url: str):
+    """
+    Waits until a target has fewer than SEND_MAX_PENDING_PER_TARGET
+    unfinished jobs. Relay workers block here during a flood, so their
+    RelayQueue fills up and its overflow policy applies as in normal mode.
+    """
+    async with send_slots:
+        await send_slots.wait_for(
+            lambda: pending_sends.get(webhook_url, 0) < SEND_MAX_PENDING_PER_TARGET
+        )
+        pending_sends[webhook_url] = pending_sends.get(webhook_url, 0) + 1
+
+
+async def drain_send_results():
+    """
+    Runs in the gateway process. Applies stats and reports errors of
+    jobs finished by the sender processes, so configs are only ever
+    written by the gateway. Frees the send slots of finished jobs.
+    """
+    while True:
+        await asyncio.sleep(SEND_RESULTS_INTERVAL)
+
+        try:
+            results = await run_send_queue(take_send_results)
+        except sqlite3.Error as e:
+            print(f"[ERROR] Failed to read send results: {e}")
+            continue
+
+        if not results:
+            continue
+
+        async with send_slots:
+            for _, _, webhook_url, _, _ in results:
+                pending_sends[webhook_url] = max(
+                    0, pending_sends.get(webhook_url, 0) - 1
+                )
+            send_slots.notify_all()
+
+        copied = {}
+        for _, guild_id, _, count, error in results:
+            guild = client.get_guild(guild_id)
+
+            if error:
+                await send_error(guild, error)
+            copied[guild_id] = copied.get(guild_id, 0) + count
+
+        for guild_id, count in copied.items():
+            guild = client.get_guild(guild_id)
+            if guild and count:
+                await add_copied_messages(guild, count)
+
+
+async def deliver(
+    target: discord.TextChannel,
+    username: str,
+    avatar: str,
+    content: str,
+    attachments: list,
+    mode: str,
+    count=None,
+):
+    """
+    Sends one message to a target channel through its webhook, either
+    right away or, in split mode, by handing it to the sender processes.
+    In split mode this waits while the target already has
+    SEND_MAX_PENDING_PER_TARGET unfinished jobs.
+
+    Args:
+        target (discord.TextChannel): Channel to send to
+        username (str): Name shown on the webhook message
+        avatar (str): Avatar URL shown on the webhook message
+        content (str): Message text, split if longer than 2000 characters
+        attachments (list): discord.Attachment objects or stored attachment dicts
+        mode (str): One of ATTACHMENT_MODES
+        count (int | None): Copied messages this counts as in the stats,
+            defaults to the number of webhook messages sent
+
+    Returns:
+        int: Copied messages to add to the stats, 0 if queued
+    """
+    if not content and not attachments:
+        return 0
+
+    webhook = await get_or_create_webhook(target)
+    size_limit = target.guild.filesize_limit
+
+    if send_queue:
+        if not webhook.token:
+            raise RuntimeError(
+                f"Webhook of {target.mention} has no token, cannot queue sends for it."
+            )
+
+        payload = {
+            "username": username,
+            "avatar_url": avatar,
+            "content": content,
+            "attachments": [
+                a if isinstance(a, dict) else stored_attachment(a)
+                for a in attachments
+            ],
+            "mode": mode,
+            "size_limit": size_limit,
+            "count": count,
+        }
+
+        await wait_for_send_slot(webhook.url)
+        try:
+            await run_send_queue(
+                enqueue_send, target.guild.id, webhook.url, payload
+            )
+        except Exception:
+            async with send_slots:
+                pending_sends[webhook.url] -= 1
+                send_slots.notify_all()
+            raise
+
+        return 0
+
+    if attachments and isinstance(attachments[0], dict):
+        files, links = await prepare_stored_attachments(attachments, mode, size_limit)
+    else:
+        files, links = await prepare_attachments(attachments, mode, size_limit)
+
+    sent = await send_via_webhook(
+        webhook, content, username, avatar, files=files, links=links
+    )
+    if not sent:
+        return 0
+
+    return sent if count is None else count
+
+
+async def run_sender(path: str):
+    """
+    Main loop of a sender process: claims jobs from the send queue,
+    downloads attachments and sends them through the webhook URL.
+    """
+    connection = open_send_queue(path)
+    print(f"[SENDER {os.getpid()}] Waiting for jobs in {path}")
+
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                job = claim_send_job(connection)
+            except sqlite3.Error as e:
+                print(f"[SENDER {os.getpid()}] Failed to claim a job: {e}")
+                await asyncio.sleep(SENDER_ERROR_BACKOFF)
+                continue
+
+            if not job:
+                await asyncio.sleep(SENDER_POLL_INTERVAL)
+                continue
+
+            job_id, guild_id, webhook_url, payload = job
+            payload = json.loads(payload)
+            copied = 0
+            error = None
+
+            try:
+                webhook = discord.Webhook.from_url(webhook_url, session=session)
+
+                files, links = await prepare_stored_attachments(
+                    payload["attachments"],
+                    payload["mode"],
+                    payload["size_limit"],
+                    session=session,
+                )
+
+                sent = await send_via_webhook(
+                    webhook,
+                    payload["content"],
+                    payload["username"],
+                    payload["avatar_url"],
+                    files=files,
+                    links=links,
+                )
+                if sent:
+                    copied = sent if payload["count"] is None else payload["count"]
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+
+            # Keep retrying before claiming anything else: an unfinished job
+            # keeps its target busy and would be sent again after the timeout
+            while True:
+                try:
+                    finish_send_job(
+                        connection, job_id, guild_id, webhook_url, copied, error
+                    )
+                    break
+                except sqlite3.Error as e:
+                    print(f"[SENDER {os.getpid()}] Failed to finish job {job_id}: {e}")
+                    await asyncio.sleep(SENDER_ERROR_BACKOFF)
+
+
+def run_sender_process(path: str):
+    try:
+        asyncio.run(run_sender(path))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_sender_pool(path: str, workers: int):
+    processes = [
+        multiprocessing.Process(target=run_sender_process, args=(path,))
+        for _ in range(workers)
+    ]
+
+    for process in processes:
+        process.start()
+
+    for process in processes:
+        process.join()
+
+
+# ==================================================
+# Channel archives
+# ==================================================
+
+
+def get_archive_dir(channel_id: int):
+    return os.path.join(ARCHIVE_FOLDER, str(channel_id))
+
+
+def get_archive_path(channel_id: int):
+    return os.path.join(get_archive_dir(channel_id), "messages.jsonl.gz")
+
+
+def get_archive_attachment_dir(channel_id: int):
+    return os.path.join(get_archive_dir(channel_id), "attachments")
+
+
+def get_archive_manifest_path(channel_id: int):
+    return os.path.join(get_archive_dir(channel_id), "manifest.json")
+
+
+def load_archive_manifest(channel_id: int):
+    path = get_archive_manifest_path(channel_id)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_archive_manifest(channel: discord.TextChannel):
+    os.makedirs(get_archive_dir(channel.id), exist_ok=True)
+    with open(get_archive_manifest_path(channel.id), "w") as f:
+        json.dump(
+            {
+                "guild_id": channel.guild.id,
+                "channel_id": channel.id,
+                "channel_name": channel.name,
+            },
+            f,
+            indent=4,
+        )
+
+
+def can_import_archive(channel_id: int, guild_id: int):
+    """
+    Checks whether a guild may replay an archive. Archives without a
+    manifest have no known owner and count as foreign.
+    """
+    if ARCHIVE_ALLOW_CROSS_GUILD:
+        return True
+
+    manifest = load_archive_manifest(channel_id)
+    return manifest is not None and manifest.get("guild_id") == guild_id
+
+
+def get_archive_lock(channel_id: int):
+    if channel_id not in archive_locks:
+        archive_locks[channel_id] = asyncio.Lock()
+    return archive_locks[channel_id]
+
+
+def iter_archive(channel_id: int, path=None):
+    """
+    Yields the intact records of a channel archive, oldest → newest.
+
+    The archive is a gzip file made of one member per flushed batch.
+    If the bot died while writing a batch, the tail is truncated;
+    iteration stops there and everything before it is still returned.
+
+    Args:
+        channel_id (int): Source channel ID the archive was created from
+        path (str | None): Read this file instead of the default location
+    """
+    path = path or get_archive_path(channel_id)
+
+    if not os.path.exists(path):
+        return
+
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+    except (EOFError, OSError, json.JSONDecodeError):
+        print(f"[WARN] Archive {channel_id} is truncated, ignoring damaged tail")
+
+
+def append_archive_records(channel_id: int, records, path=None, mode="at"):
+    os.makedirs(get_archive_dir(channel_id), exist_ok=True)
+    with gzip.open(path or get_archive_path(channel_id), mode, encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def get_archive_resume_point(channel_id: int):
+    """
+    Finds the newest archived message ID and repairs a truncated archive
+    so new batches are not appended behind a damaged gzip member.
+
+    Returns:
+        int | None: Newest archived message ID or None for a new archive
+    """
+    path = get_archive_path(channel_id)
+    if not os.path.exists(path):
+        return None
+
+    last_id = None
+    damaged = False
+
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    last_id = json.loads(line)["id"]
+    except (EOFError, OSError, json.JSONDecodeError):
+        damaged = True
+
+    if damaged:
+        tmp_path = path + ".tmp"
+        append_archive_records(
+            channel_id, iter_archive(channel_id), path=tmp_path, mode="wt"
+        )
+        os.replace(tmp_path, path)
+
+    return last_id
+
+
+async def export_channel_archive(channel: discord.TextChannel):
+    """
+    Streams the history of a channel, including attachments, into a
+    local compressed JSONL archive.
+
+    If an archive for this channel already exists the export resumes
+    after the newest archived message, so running it again only
+    fetches what is new.
+
+    Only one export per channel runs at a time, otherwise both runs would
+    resume from the same point and append the same batches.
+
+    Args:
+        channel (discord.TextChannel): Channel to export
+
+    Returns:
+        int: Number of newly archived messages
+    """
+    async with get_archive_lock(channel.id):
+        save_archive_manifest(channel)
+
+        last_id = get_archive_resume_point(channel.id)
+        after = discord.Object(id=last_id) if last_id else None
+
+        attachment_dir = get_archive_attachment_dir(channel.id)
+        os.makedirs(attachment_dir, exist_ok=True)
+
+        batch = []
+        archived = 0
+
+        async for msg in channel.history(limit=None, after=after, oldest_first=True):
+            if isinstance(msg.author, discord.Member):
+                username = msg.author.display_name
+            else:
+                username = msg.author.name
+
+            attachments = []
+            for attachment in msg.attachments:
+                stored_name = f"{msg.id}_{attachment.id}_{attachment.filename}"
+                await attachment.save(os.path.join(attachment_dir, stored_name))
+                attachments.append(
+                    {
+                        "filename": attachment.filename,
+                        "path": stored_name,
+                        "url": attachment.url,
+                        "size": attachment.size,
+                        "content_type": attachment.content_type,
+                    }
+                )
+
+            # Skip completely empty messages
+            if not msg.content and not attachments:
+                continue
+
+            batch.append(
+                {
+                    "id": msg.id,
+                    "created_at": msg.created_at.isoformat(),
+                    "author_id": msg.author.id,
+                    "username": username,
+                    "avatar_url": msg.author.display_avatar.url,
+                    "content": msg.content or "",
+                    "attachments": attachments,
+                }
+            )
+
+            if len(batch) >= ARCHIVE_BATCH_SIZE:
+                append_archive_records(channel.id, batch)
+                archived += len(batch)
+                batch = []
+
+        if batch:
+            append_archive_records(channel.id, batch)
+            archived += len(batch)
+
+        return archived
+
+
+async def import_channel_archive(
+    channel_id: int, target: discord.TextChannel, mode=DEFAULT_ATTACHMENT_MODE
+):
+    """
+    Replays a channel archive into a target channel through its webhook.
+
+    Archived files are uploaded from disk. Files over the target's upload
+    limit (or all of them in "link" mode) are sent as their original URL.
+    In split mode the records are handed to the sender processes.
+
+    Args:
+        channel_id (int): Source channel ID the archive was created from
+        target (discord.TextChannel): Channel to replay into
+        mode (str): One of ATTACHMENT_MODES
+
+    Sent messages are added to the stats, also if the import is interrupted.
+
+    Returns:
+        int: Number of webhook messages sent, 0 in split mode
+    """
+    attachment_dir = os.path.abspath(get_archive_attachment_dir(channel_id))
+    copied_count = 0
+
+    try:
+        for record in iter_archive(channel_id):
+            attachments = [
+                dict(a, path=os.path.join(attachment_dir, a["path"]))
+                for a in record["attachments"]
+            ]
+
+            copied_count += await deliver(
+                target,
+                record["username"],
+                record["avatar_url"],
+                record["content"],
+                attachments,
+                mode,
+            )
+    finally:
+        await add_copied_messages(target.guild, copied_count)
+
+    return copied_count
+
+
+async def add_copied_messages(guild: discord.Guild, count: int):
+    if not count:
+        return
+
+    lock = get_guild_lock(guild.id)
+    async with lock:
+        config = load_and_prepare_config(guild.id)
+        if not config:
+            return
+
+        stats = config.setdefault("stats", {})
+        stats["messages_copied"] = stats.get("messages_copied", 0) + count
+        save_config(guild.id, config)
+
+
+# ==================================================
+# Relay filters
+# ==================================================
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over a set of keywords (case-insensitive).
+
+    Built once, it finds whether any keyword occurs in a text in a single
+    pass over the text, no matter how many keywords it contains.
+    """
+
+    def __init__(self, keywords):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [False]
+
+        for keyword in keywords:
+            state = 0
+            for char in keyword.lower():
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(False)
+                    self.goto[state][char] = next_state
+                state = next_state
+            self.output[state] = True
+
+        # Breadth-first so every fail link points to an already finished state
+        pending = deque(self.goto[0].values())
+        while pending:
+            state = pending.popleft()
+
+            for char, next_state in self.goto[state].items():
+                pending.append(next_state)
+
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                if self.output[self.fail[next_state]]:
+                    self.output[next_state] = True
+
+    def search(self, text: str):
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            if output[state]:
+                return True
+
+        return False
+
+
+class RelayFilter:
+    """
+    Filter rules of a single relay, compiled once per config change.
+
+    All configured rules must pass for a message to be relayed:
+
+    - keywords: content contains at least one keyword (case-insensitive)
+    - regex: content matches at least one pattern
+      (keywords and regex together count as one content rule)
+    - allowed_authors / blocked_authors: author ID lists
+    - attachment_types: at least one attachment has one of these types,
+      either a MIME major type ("image", "video") or an extension (".pdf")
+    """
+
+    def __init__(self, rules: dict):
+        keywords = [k for k in rules.get("keywords", []) if k]
+        self.keywords = KeywordAutomaton(keywords) if keywords else None
+
+        patterns = rules.get("regex", [])
+        if isinstance(patterns, str):
+            patterns = [patterns]
+
+        compiled = []
+        for pattern in patterns:
+            try:
+                compiled.append(re.compile(pattern))
+            except re.error as e:
+                print(f"[WARN] Ignoring invalid relay regex {pattern!r}: {e}")
+
+        self.regex_patterns = compiled
+        # Patterns without groups are merged so the content is scanned once.
+        # Group numbers and backreferences would change meaning when merged.
+        if len(compiled) > 1 and not any(p.groups for p in compiled):
+            try:
+                self.regex_patterns = [
+                    re.compile("|".join(f"(?:{p.pattern})" for p in compiled))
+                ]
+            except re.error:
+                # Inline flags are only allowed at the start of a pattern
+                pass
+
+        self.allowed_authors = {int(a) for a in rules.get("allowed_authors", [])}
+        self.blocked_authors = {int(a) for a in rules.get("blocked_authors", [])}
+        self.attachment_types = {
+            t.lower() for t in rules.get("attachment_types", []) if t
+        }
+
+    def matches(self, message: discord.Message):
+        author_id = message.author.id
+
+        if author_id in self.blocked_authors:
+            return False
+
+        if self.allowed_authors and author_id not in self.allowed_authors:
+            return False
+
+        if self.keywords or self.regex_patterns:
+            content = message.content or ""
+
+            if not (
+                (self.keywords and self.keywords.search(content))
+                or any(p.search(content) for p in self.regex_patterns)
+            ):
+                return False
+
+        if self.attachment_types:
+            for attachment in message.attachments:
+                major_type = (attachment.content_type or "").split("/")[0]
+                extension = os.path.splitext(attachment.filename)[1].lower()
+
+                if (
+                    major_type in self.attachment_types
+                    or extension in self.attachment_types
+                ):
+                    break
+            else:
+                return False
+
+        return True
+
+
+def get_relay_filter(guild_id: int, relay: dict):
+    """
+    Returns the compiled filter of a relay, or None if it has no rules.
+
+    Compiled filters are cached per relay. apply_config drops the cached
+    filters of a guild whenever its config is saved or reloaded.
+    """
+    rules = relay.get("filters")
+    if not rules:
+        return None
+
+    key = (guild_id, relay["source"])
+    relay_filter = filter_cache.get(key)
+    if relay_filter is None:
+        relay_filter = RelayFilter(rules)
+        filter_cache[key] = relay_filter
+
+    return relay_filter
+
+
+def describe_filters(relay: dict):
+    rules = relay.get("filters")
+    if not rules:
+        return "none"
+
+    return ", ".join(
+        f"{name} ({len(value) if isinstance(value, list) else 1})"
+        for name, value in rules.items()
+        if value
+    )
+
+
+def describe_relay_queue(guild_id: int, relay: dict):
+    queue = relay_queues.get((guild_id, relay["source"]))
+    if queue:
+        return queue.describe()
+
+    size = relay.get("queue_size", DEFAULT_QUEUE_SIZE)
+    return f"0/{size} pending | dropped: 0 | coalesced: 0"
+
+
+def parse_list_option(value: str):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+# ==================================================
+# Relay queues
+# ==================================================
+
+
+async def relay_message(msg: discord.Message, target: discord.TextChannel, mode: str):
+    guild = target.guild
+
+    try:
+        username = msg.author.display_name
+        avatar = msg.author.display_avatar.url
+        content = msg.content or ""
+
+        copied = await deliver(
+            target, username, avatar, content, msg.attachments, mode, count=1
+        )
+        if not copied:
+            return
+
+        # print("[DEBUG] Message relayed successfully")
+        await add_copied_messages(guild, copied)
+
+    except Exception as e:
+        # print(f"[DEBUG] Relay error: {e}")
+        await send_error(guild, str(e))
+
+
+async def relay_digest(messages: list, target: discord.TextChannel):
+    """
+    Sends messages that were coalesced during a flood as one digest.
+    Attachments are only linked, nothing is downloaded.
+    """
+    guild = target.guild
+
+    try:
+        lines = [f"**Flood digest: {len(messages)} messages**"]
+        for msg in messages:
+            links = [attachment.url for attachment in msg.attachments]
+            lines.append(
+                " ".join([f"**{msg.author.display_name}**: {msg.content}", *links])
+            )
+
+        copied = await deliver(
+            target,
+            "DragonCopy",
+            client.user.display_avatar.url,
+            "\n".join(lines),
+            [],
+            "link",
+            count=len(messages),
+        )
+        if copied:
+            await add_copied_messages(guild, copied)
+
+    except Exception as e:
+        await send_error(guild, str(e))
+
+
+class RelayQueue:
+    """
+    Bounded queue of pending messages for one relay.
+
+    A single worker task drains it in order, waiting out the relay delay
+    of each message, so a flood in the source channel never creates more
+    than `queue_size` pending messages. What happens when the queue is
+    full depends on the relay's overflow policy (see OVERFLOW_POLICIES).
+    """
+
+    def __init__(self, guild: discord.Guild, relay: dict):
+        self.guild = guild
+        self.source_id = relay["source"]
+        self.items = deque()
+        self.not_empty = asyncio.Event()
+        self.paused = False
+        self.pause_notice = None
+        self.dropped = 0
+        self.coalesced = 0
+        self.configure(relay)
+        self.worker = asyncio.create_task(self.run())
+
+    def configure(self, relay: dict):
+        self.maxsize = max(1, relay.get("queue_size", DEFAULT_QUEUE_SIZE))
+        self.policy = relay.get("overflow", DEFAULT_OVERFLOW_POLICY)
+
+    def put(self, msg: discord.Message, target: discord.TextChannel, delay, mode):
+        if self.paused:
+            self.dropped += 1
+            return
+
+        if len(self.items) >= self.maxsize:
+            if self.policy == "coalesce":
+                newest = self.items[-1]
+                if len(newest["messages"]) < MAX_DIGEST_MESSAGES:
+                    newest["messages"].append(msg)
+                    self.coalesced += 1
+                else:
+                    self.dropped += 1
+                return
+
+            if self.policy == "pause":
+                self.paused = True
+                self.dropped += 1
+                self.pause_notice = asyncio.create_task(
+                    send_error(
+                        self.guild,
+                        f"Relay from <#{self.source_id}> paused: "
+                        f"{self.maxsize} messages pending. "
+                        "New messages are dropped until the queue is drained.",
+                    )
+                )
+                return
+
+            self.items.popleft()
+            self.dropped += 1
+
+        self.items.append(
+            {
+                "due": asyncio.get_running_loop().time() + delay,
+                "messages": [msg],
+                "target": target,
+                "mode": mode,
+            }
+        )
+        self.not_empty.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            if not self.items:
+                if self.paused:
+                    self.paused = False
+                    # Keep the notices in order if the queue drained instantly
+                    await self.pause_notice
+                    await send_error(
+                        self.guild, f"Relay from <#{self.source_id}> resumed."
+                    )
+
+                self.not_empty.clear()
+                await self.not_empty.wait()
+                continue
+
+            entry = self.items.popleft()
+
+            wait = entry["due"] - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            # print("[DEBUG] Delayed send triggered")
+
+            messages = entry["messages"]
+            if len(messages) == 1:
+                await relay_message(messages[0], entry["target"], entry["mode"])
+            else:
+                await relay_digest(messages, entry["target"])
+
+    def stop(self):
+        self.worker.cancel()
+
+    def describe(self):
+        state = " (paused)" if self.paused else ""
+        return (
+            f"{len(self.items)}/{self.maxsize} pending{state} | "
+            f"dropped: {self.dropped} | coalesced: {self.coalesced}"
+        )
+
+
+def get_relay_queue(guild: discord.Guild, relay: dict):
+    key = (guild.id, relay["source"])
+
+    queue = relay_queues.get(key)
+    if queue is None:
+        queue = RelayQueue(guild, relay)
+        relay_queues[key] = queue
+    else:
+        queue.configure(relay)
+
+    return queue
 
-    webhooks = await channel.webhooks()
-    for hook in webhooks:
-        if hook.name == "DragonCopy":
-            webhook_cache[channel.id] = hook
-            return hook
 
-    hook = await channel.create_webhook(name="DragonCopy")
-    webhook_cache[channel.id] = hook
-    return hook
+def stop_relay_queue(guild_id: int, source_id: int):
+    queue = relay_queues.pop((guild_id, source_id), None)
+    if queue:
+        queue.stop()
 
 
 # ---------- Setup UI ----------
@@ -204,10 +1813,14 @@ async def stop_relay(interaction: discord.Interaction, source: discord.TextChann
         return
 
     relays = config.get("relays", [])
-    new_relays = [r for r in relays if r["source"] != source.id]
+    # Also removes malformed relays, so a broken entry can always be stopped
+    new_relays = [
+        r for r in relays if not (isinstance(r, dict) and r.get("source") == source.id)
+    ]
 
     config["relays"] = new_relays
     save_config(guild_id, config)
+    stop_relay_queue(guild_id, source.id)
 
     await interaction.response.send_message(
         f"Relay for {source.mention} stopped.", ephemeral=True
@@ -220,7 +1833,8 @@ async def start_relay(
     interaction: discord.Interaction,
     source: discord.TextChannel,
     target: discord.TextChannel,
-    delay_seconds: int,
+    delay_seconds: app_commands.Range[int, 0],
+    attachment_mode: Literal["auto", "upload", "link"] = DEFAULT_ATTACHMENT_MODE,
 ):
     guild_id = interaction.guild.id
 
@@ -231,10 +1845,15 @@ async def start_relay(
         )
         return
 
-    relay = {"source": source.id, "target": target.id, "delay": delay_seconds}
+    relay = {
+        "source": source.id,
+        "target": target.id,
+        "delay": delay_seconds,
+        "attachment_mode": attachment_mode,
+    }
     # prevent duplicates
     for r in config["relays"]:
-        if r["source"] == source.id:
+        if isinstance(r, dict) and r.get("source") == source.id:
             await interaction.response.send_message(
                 f"A relay from {source.mention} already exists. Please stop it first.",
                 ephemeral=True,
@@ -244,11 +1863,220 @@ async def start_relay(
     save_config(guild_id, config)
 
     await interaction.response.send_message(
-        f"Relay started:\n{source.mention} → {target.mention}\nDelay: {delay_seconds}s",
+        f"Relay started:\n{source.mention} → {target.mention}\nDelay: {delay_seconds}s\n"
+        f"Attachments: {attachment_mode}",
+        ephemeral=True,
+    )
+
+
+@tree.command(
+    name="set_attachment_mode", description="Choose how a relay mirrors attachments"
+)
+@app_commands.describe(
+    mode="auto: upload what fits and link the rest, upload: always upload, "
+    "link: only post the original links"
+)
+@app_commands.checks.has_permissions(administrator=True)
+async def set_attachment_mode(
+    interaction: discord.Interaction,
+    source: discord.TextChannel,
+    mode: Literal["auto", "upload", "link"],
+):
+    guild_id = interaction.guild.id
+
+    config = load_and_prepare_config(guild_id)
+    if not config:
+        await interaction.response.send_message(
+            "Setup not completed. Please run /setup first.", ephemeral=True
+        )
+        return
+
+    relay = next(
+        (
+            r
+            for r in config["relays"]
+            if isinstance(r, dict) and r.get("source") == source.id
+        ),
+        None,
+    )
+    if not relay:
+        await interaction.response.send_message(
+            f"No relay from {source.mention} exists.", ephemeral=True
+        )
+        return
+
+    relay["attachment_mode"] = mode
+    save_config(guild_id, config)
+
+    await interaction.response.send_message(
+        f"Attachments of {source.mention} are now mirrored in {mode} mode.",
+        ephemeral=True,
+    )
+
+
+@tree.command(
+    name="set_relay_queue", description="Limit pending messages of a relay"
+)
+@app_commands.describe(
+    size="Maximum number of pending messages",
+    overflow="drop_oldest: discard oldest, coalesce: merge into a digest, "
+    "pause: drop new messages until the queue is drained",
+)
+@app_commands.checks.has_permissions(administrator=True)
+async def set_relay_queue(
+    interaction: discord.Interaction,
+    source: discord.TextChannel,
+    size: app_commands.Range[int, 1, 10000],
+    overflow: Literal["drop_oldest", "coalesce", "pause"] = DEFAULT_OVERFLOW_POLICY,
+):
+    guild = interaction.guild
+
+    config = load_and_prepare_config(guild.id)
+    if not config:
+        await interaction.response.send_message(
+            "Setup not completed. Please run /setup first.", ephemeral=True
+        )
+        return
+
+    relay = next(
+        (
+            r
+            for r in config["relays"]
+            if isinstance(r, dict) and r.get("source") == source.id
+        ),
+        None,
+    )
+    if not relay:
+        await interaction.response.send_message(
+            f"No relay from {source.mention} exists.", ephemeral=True
+        )
+        return
+
+    relay["queue_size"] = size
+    relay["overflow"] = overflow
+    save_config(guild.id, config)
+
+    if (guild.id, source.id) in relay_queues:
+        relay_queues[(guild.id, source.id)].configure(relay)
+
+    await interaction.response.send_message(
+        f"Queue of {source.mention} limited to {size} messages ({overflow}).",
+        ephemeral=True,
+    )
+
+
+@tree.command(name="set_relay_filter", description="Set filter rules for a relay")
+@app_commands.describe(
+    keywords="Comma-separated keywords, at least one must appear",
+    regex="Regular expression the message content must match",
+    allowed_authors="Comma-separated user IDs or mentions allowed to be relayed",
+    blocked_authors="Comma-separated user IDs or mentions never relayed",
+    attachment_types="Comma-separated types like image, video or .pdf",
+)
+@app_commands.checks.has_permissions(administrator=True)
+async def set_relay_filter(
+    interaction: discord.Interaction,
+    source: discord.TextChannel,
+    keywords: str = None,
+    regex: str = None,
+    allowed_authors: str = None,
+    blocked_authors: str = None,
+    attachment_types: str = None,
+):
+    guild_id = interaction.guild.id
+
+    config = load_and_prepare_config(guild_id)
+    if not config:
+        await interaction.response.send_message(
+            "Setup not completed. Please run /setup first.", ephemeral=True
+        )
+        return
+
+    relay = next(
+        (
+            r
+            for r in config["relays"]
+            if isinstance(r, dict) and r.get("source") == source.id
+        ),
+        None,
+    )
+    if not relay:
+        await interaction.response.send_message(
+            f"No relay from {source.mention} exists.", ephemeral=True
+        )
+        return
+
+    if regex is not None:
+        try:
+            re.compile(regex)
+        except re.error as e:
+            await interaction.response.send_message(
+                f"Invalid regex: {e}", ephemeral=True
+            )
+            return
+
+    filters = relay.setdefault("filters", {})
+
+    # Only the given options are replaced, the rest stays as configured
+    if keywords is not None:
+        filters["keywords"] = parse_list_option(keywords)
+    if regex is not None:
+        filters["regex"] = [regex]
+    if allowed_authors is not None:
+        filters["allowed_authors"] = [
+            int(a) for a in re.findall(r"\d+", allowed_authors)
+        ]
+    if blocked_authors is not None:
+        filters["blocked_authors"] = [
+            int(a) for a in re.findall(r"\d+", blocked_authors)
+        ]
+    if attachment_types is not None:
+        filters["attachment_types"] = parse_list_option(attachment_types)
+
+    save_config(guild_id, config)
+
+    await interaction.response.send_message(
+        f"Filters for {source.mention} updated: {describe_filters(relay)}",
         ephemeral=True,
     )
 
 
+@tree.command(name="clear_relay_filter", description="Remove all filters of a relay")
+@app_commands.checks.has_permissions(administrator=True)
+async def clear_relay_filter(
+    interaction: discord.Interaction, source: discord.TextChannel
+):
+    guild_id = interaction.guild.id
+
+    config = load_and_prepare_config(guild_id)
+    if not config:
+        await interaction.response.send_message(
+            "Setup not completed. Please run /setup first.", ephemeral=True
+        )
+        return
+
+    relay = next(
+        (
+            r
+            for r in config["relays"]
+            if isinstance(r, dict) and r.get("source") == source.id
+        ),
+        None,
+    )
+    if not relay:
+        await interaction.response.send_message(
+            f"No relay from {source.mention} exists.", ephemeral=True
+        )
+        return
+
+    relay.pop("filters", None)
+    save_config(guild_id, config)
+
+    await interaction.response.send_message(
+        f"Filters for {source.mention} removed.", ephemeral=True
+    )
+
+
 @tree.command(name="copy_channel", description="Copy a full channel into another")
 @app_commands.checks.has_permissions(administrator=True)
 async def copy_channel(interaction: discord.Interaction):
@@ -270,6 +2098,111 @@ async def copy_channel(interaction: discord.Interaction):
     )
 
 
+@tree.command(
+    name="export_channel", description="Export a channel into a local archive"
+)
+@app_commands.checks.has_permissions(administrator=True)
+async def export_channel(interaction: discord.Interaction, source: discord.TextChannel):
+    guild = interaction.guild
+
+    config = load_and_prepare_config(guild.id)
+    if not config:
+        await interaction.response.send_message(
+            "Setup not completed. Please run /setup first.", ephemeral=True
+        )
+        return
+
+    if get_archive_lock(source.id).locked():
+        await interaction.response.send_message(
+            f"An export of {source.mention} is already running.", ephemeral=True
+        )
+        return
+
+    await interaction.response.send_message(
+        f"Exporting {source.mention} into the archive...\n"
+        "The result will be posted in the error channel.",
+        ephemeral=True,
+    )
+
+    # Large exports outlive the interaction token, so report to the
+    # error channel instead of answering the interaction
+    try:
+        archived = await export_channel_archive(source)
+    except Exception as e:
+        await send_error(
+            guild,
+            f"Export of {source.mention} interrupted: {e}\nRun it again to resume.",
+        )
+        return
+
+    await send_notice(
+        guild,
+        f"Export of {source.mention} finished. New messages archived: {archived}\n"
+        f"Archive ID: {source.id}",
+    )
+
+
+@tree.command(
+    name="import_archive", description="Replay a channel archive into a channel"
+)
+@app_commands.checks.has_permissions(administrator=True)
+async def import_archive(
+    interaction: discord.Interaction,
+    archive_id: str,
+    target: discord.TextChannel,
+    attachment_mode: Literal["auto", "upload", "link"] = DEFAULT_ATTACHMENT_MODE,
+):
+    guild = interaction.guild
+
+    config = load_and_prepare_config(guild.id)
+    if not config:
+        await interaction.response.send_message(
+            "Setup not completed. Please run /setup first.", ephemeral=True
+        )
+        return
+
+    # Archives of other servers are reported as missing, so their IDs
+    # cannot be probed from here
+    if (
+        not archive_id.isdigit()
+        or not os.path.exists(get_archive_path(int(archive_id)))
+        or not can_import_archive(int(archive_id), guild.id)
+    ):
+        await interaction.response.send_message(
+            f"No archive found for ID {archive_id}.", ephemeral=True
+        )
+        return
+
+    await interaction.response.send_message(
+        f"Importing archive {archive_id} into {target.mention}...\n"
+        "The result will be posted in the error channel.",
+        ephemeral=True,
+    )
+
+    # Large imports outlive the interaction token, so report to the
+    # error channel instead of answering the interaction
+    try:
+        copied_count = await import_channel_archive(
+            int(archive_id), target, attachment_mode
+        )
+    except Exception as e:
+        await send_error(
+            guild,
+            f"Import of archive {archive_id} into {target.mention} interrupted: {e}",
+        )
+        return
+
+    if send_queue:
+        result = "Messages were queued for the sender processes."
+    else:
+        result = f"Messages sent: {copied_count}"
+
+    await send_notice(
+        guild,
+        f"Import of archive {archive_id} into {target.mention} finished. {result}",
+    )
+
+
 @tree.command(name="setup", description="Initial bot setup")
 @app_commands.checks.has_permissions(administrator=True)
 async def setup_command(interaction: discord.Interaction):
@@ -356,6 +2289,9 @@ async def bot_info(interaction: discord.Interaction):
         relay_info = "No active relays"
 
     total_copied = config["stats"]["messages_copied"]
+    guild_queues = [q for (g, _), q in relay_queues.items() if g == guild_id]
+    total_dropped = sum(q.dropped for q in guild_queues)
+    total_coalesced = sum(q.coalesced for q in guild_queues)
 
     info_text = (
         "**Bot Info Dump**\n"
@@ -363,7 +2299,10 @@ async def bot_info(interaction: discord.Interaction):
         f"- Server ID:\n{guild_id}\n\n"
         f"- Command User:\n{user.id} - {user}\n\n"
         f"- Stats:\n"
-        f"Messages copied total: {total_copied}"
+        f"Messages copied total: {total_copied}\n"
+        f"Messages dropped since start: {total_dropped}\n"
+        f"Messages coalesced since start: {total_coalesced}\n\n"
+        f"- Performance:\n{format_performance_stats()}"
     )
 
     error_channel_id = config["error_channel"]
@@ -382,6 +2321,58 @@ async def bot_info(interaction: discord.Interaction):
     )
 
 
+@tree.command(
+    name="profile", description="Send a CPU or memory profile to the error channel"
+)
+@app_commands.describe(
+    mode="cpu: cProfile of everything running, memory: tracemalloc allocation diff",
+    seconds="How long to profile",
+)
+@app_commands.checks.has_permissions(administrator=True)
+async def profile(
+    interaction: discord.Interaction,
+    mode: Literal["cpu", "memory"] = "cpu",
+    seconds: app_commands.Range[int, 1, 60] = 10,
+):
+    guild = interaction.guild
+
+    config = load_and_prepare_config(guild.id)
+    if not config:
+        await interaction.response.send_message(
+            "Setup not completed. Please run /setup first.", ephemeral=True
+        )
+        return
+
+    channel = guild.get_channel(config["error_channel"])
+    if not channel:
+        await interaction.response.send_message(
+            "Error channel not found.", ephemeral=True
+        )
+        return
+
+    if profile_lock.locked():
+        await interaction.response.send_message(
+            "A profile is already running.", ephemeral=True
+        )
+        return
+
+    await interaction.response.send_message(
+        f"Running a {mode} profile for {seconds}s. "
+        "The summary will be sent to the error channel.",
+        ephemeral=True,
+    )
+
+    async with profile_lock:
+        if mode == "cpu":
+            summary = await run_cpu_profile(seconds)
+        else:
+            summary = await run_memory_profile(seconds)
+
+    await channel.send(f"**{mode.upper()} profile ({seconds}s)**")
+    for part in chunk_lines(f"{format_performance_stats()}\n\n{summary}", 1900):
+        await channel.send(f"```\n{part}\n```")
+
+
 @tree.command(name="instances", description="Show active relay instances")
 @app_commands.checks.has_permissions(administrator=True)
 async def instances(interaction: discord.Interaction):
@@ -414,6 +2405,9 @@ async def instances(interaction: discord.Interaction):
 
         message_lines.append(
             f"{i}) {source_name} → {target_name}\nDelay: {delay} seconds\n"
+            f"Filters: {describe_filters(relay)}\n"
+            f"Attachments: {relay.get('attachment_mode', DEFAULT_ATTACHMENT_MODE)}\n"
+            f"Queue: {describe_relay_queue(interaction.guild.id, relay)}\n"
         )
 
     await interaction.response.send_message("\n".join(message_lines), ephemeral=True)
@@ -439,39 +2433,24 @@ class CopyChannelSelect(discord.ui.ChannelSelect):
         target_channel = guild.get_channel(selected_channel.id)
 
         try:
-            webhook = await get_or_create_webhook(target_channel)
-
             username = self.source_message.author.display_name
             avatar = self.source_message.author.display_avatar.url
             content = self.source_message.content or ""
-
-            files = []
             attachments = self.source_message.attachments or []
-            for attachment in attachments:
-                file = await attachment.to_file()
-                files.append(file)
 
-            if not content and not files:
+            if not content and not attachments:
                 return
 
-            parts = split_message(content) if content else [""]
-
-            for i, part in enumerate(parts):
-                if i == 0 and files:
-                    await webhook.send(
-                        content=part,
-                        username=username,
-                        avatar_url=avatar,
-                        files=files,
-                    )
-                else:
-                    await webhook.send(
-                        content=part,
-                        username=username,
-                        avatar_url=avatar,
-                    )
-
-                await asyncio.sleep(1.0)
+            copied = await deliver(
+                target_channel,
+                username,
+                avatar,
+                content,
+                attachments,
+                DEFAULT_ATTACHMENT_MODE,
+                count=1,
+            )
+            await add_copied_messages(guild, copied)
 
             await interaction.response.send_message(
                 f"Message copied to {target_channel.mention}", ephemeral=True
@@ -590,8 +2569,6 @@ class StartCopyButton(discord.ui.Button):
         )
 
         try:
-            webhook = await get_or_create_webhook(target_channel)
-            config = load_and_prepare_config(guild.id)
             copied_count = 0
 
             # Fetch messages oldest → newest
@@ -605,45 +2582,17 @@ class StartCopyButton(discord.ui.Button):
                 avatar = msg.author.display_avatar.url
                 content = msg.content or ""
 
-                files = []
-                attachments = msg.attachments or []
-
-                for attachment in attachments:
-                    file = await attachment.to_file()
-                    files.append(file)
-
-                # Skip completely empty messages
-                if not content and not files:
-                    continue
-
-                parts = split_message(content) if content else [""]
-
-                for i, part in enumerate(parts):
-                    if i == 0 and files:
-                        await webhook.send(
-                            content=part,
-                            username=username,
-                            avatar_url=avatar,
-                            files=files,
-                        )
-                    else:
-                        await webhook.send(
-                            content=part, username=username, avatar_url=avatar
-                        )
-
-                    copied_count += 1
-                    await asyncio.sleep(1.0)
-            lock = get_guild_lock(guild.id)
-            async with lock:
-                config = load_and_prepare_config(guild.id)
-                if not config:
-                    return
-
-                stats = config.setdefault("stats", {})
-                stats["messages_copied"] = (
-                    stats.get("messages_copied", 0) + copied_count
+                # Completely empty messages send nothing
+                copied_count += await deliver(
+                    target_channel,
+                    username,
+                    avatar,
+                    content,
+                    msg.attachments or [],
+                    DEFAULT_ATTACHMENT_MODE,
                 )
-                save_config(guild.id, config)
+
+            await add_copied_messages(guild, copied_count)
 
         except Exception as e:
             await send_error(guild, str(e))
@@ -661,7 +2610,7 @@ async def on_message(message: discord.Message):
     if a matching relay configuration exists.
 
     - Ignores bot messages
-    - Supports delayed forwarding
+    - Supports delayed forwarding through a bounded queue per relay
     - Uses webhooks to preserve author identity
     """
     # print(f"[DEBUG] Message from {message.author} in {message.channel.id}")
@@ -680,78 +2629,27 @@ async def on_message(message: discord.Message):
         # print("[DEBUG] No config found")
         return
 
-    relays = config.get("relays", [])
-    # print(f"[DEBUG] Active relays: {relays}")
-
-    for relay in relays:
-        # print(f"[DEBUG] Checking relay: {relay}")
-
-        if message.channel.id != relay["source"]:
-            # print("[DEBUG] Channel does not match relay source")
-            continue
-
-        target_channel = guild.get_channel(relay["target"])
-        if not target_channel:
-            # print("[DEBUG] Target channel not found")
-            continue
-
-        delay = relay["delay"]
-        # print(f"[DEBUG] Relay match! Sending after {delay}s")
-
-        async def delayed_send(msg, target, delay_seconds):
-            await asyncio.sleep(delay_seconds)
-            # print("[DEBUG] Delayed send triggered")
-
-            try:
-                webhook = await get_or_create_webhook(target)
-                # print("[DEBUG] Webhook obtained")
+    relay = relay_index[guild.id].get(message.channel.id)
+    if not relay:
+        # print("[DEBUG] Channel is not a relay source")
+        return
 
-                username = msg.author.display_name
-                avatar = msg.author.display_avatar.url
-                content = msg.content or ""
+    relay_filter = get_relay_filter(guild.id, relay)
+    if relay_filter and not relay_filter.matches(message):
+        # print("[DEBUG] Message rejected by relay filter")
+        return
 
-                files = []
-                for attachment in msg.attachments:
-                    file = await attachment.to_file()
-                    files.append(file)
-
-                if not content and not files:
-                    return
-
-                parts = split_message(content) if content else [""]
-
-                for i, part in enumerate(parts):
-                    if i == 0 and files:
-                        await webhook.send(
-                            content=part,
-                            username=username,
-                            avatar_url=avatar,
-                            files=files,
-                        )
-                    else:
-                        await webhook.send(
-                            content=part,
-                            username=username,
-                            avatar_url=avatar,
-                        )
-
-                    await asyncio.sleep(1.0)
-
-                # print("[DEBUG] Message relayed successfully")
-                # --- Counter update ---
-                lock = get_guild_lock(guild.id)
-                async with lock:
-                    config = load_and_prepare_config(guild.id)
-                    if config:
-                        stats = config.setdefault("stats", {})
-                        stats["messages_copied"] = stats.get("messages_copied", 0) + 1
-                        save_config(guild.id, config)
+    target_channel = guild.get_channel(relay["target"])
+    if not target_channel:
+        # print("[DEBUG] Target channel not found")
+        return
 
-            except Exception as e:
-                # print(f"[DEBUG] Relay error: {e}")
-                await send_error(guild, str(e))
+    delay = relay["delay"]
+    attachment_mode = relay.get("attachment_mode", DEFAULT_ATTACHMENT_MODE)
+    # print(f"[DEBUG] Relay match! Sending after {delay}s")
 
-        asyncio.create_task(delayed_send(message, target_channel, delay))
+    queue = get_relay_queue(guild, relay)
+    queue.put(message, target_channel, delay, attachment_mode)
 
 
 def get_guild_lock(guild_id: int):
@@ -796,9 +2694,35 @@ async def on_app_command_error(
 
 @client.event
 async def on_ready():
+    global lag_monitor_task, send_queue, config_watcher_task, send_results_task
+
     print(f"Bot is online as {client.user}")
+
+    # on_ready fires again after reconnects, only start the monitor once
+    if lag_monitor_task is None:
+        lag_monitor_task = asyncio.create_task(monitor_loop_lag())
+
+    if config_watcher_task is None:
+        config_watcher_task = asyncio.create_task(watch_configs())
+
+    if SEND_QUEUE_PATH and send_queue is None:
+        send_queue = open_send_queue(SEND_QUEUE_PATH)
+        # Jobs left over from before a restart count against their targets
+        pending_sends.update(await run_send_queue(count_pending_sends))
+        send_results_task = asyncio.create_task(drain_send_results())
+        print(f"Split mode: sends are queued in {SEND_QUEUE_PATH}")
+
     await tree.sync()
     print("Slash commands synced.")
 
 
-client.run(TOKEN)
+if __name__ == "__main__":
+    # `python bot.py sender [N]` runs N sender processes for split mode
+    if sys.argv[1:2] == ["sender"]:
+        workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+        run_sender_pool(SEND_QUEUE_PATH or DEFAULT_SEND_QUEUE_PATH, workers)
+    else:
+        if not TOKEN:
+            raise RuntimeError("DISCORD_TOKEN environment variable not set.")
+
+        client.run(TOKEN)